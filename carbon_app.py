@@ -1,11 +1,20 @@
 import streamlit as st
 import numpy as np
-import pandas as pd
-import plotly.graph_objects as go
-import plotly.express as px
-from plotly.subplots import make_subplots
 import time
-import random
+
+# Linear model coefficients: effect per m3/hr of rougher/jameson air and per g/t of luproset
+# Jameson air has the same relationship as rougher air but half the effect
+GRADE_COEF_ROUGHER = -0.012  # Higher air rate DECREASES concentrate grade
+GRADE_COEF_JAMESON = -0.006
+GRADE_COEF_LUPROSET = 0.08  # Luproset INCREASES grade by depressing gangue
+
+TAIL_COEF_ROUGHER = -0.005  # Higher air rate DECREASES tailings carbon (more carbon floated)
+TAIL_COEF_JAMESON = -0.0025
+TAIL_COEF_LUPROSET = 0.07  # Luproset INCREASES tailings carbon (carbon depressed)
+
+RECOVERY_COEF_ROUGHER = 0.045  # Higher air rate INCREASES recovery
+RECOVERY_COEF_JAMESON = 0.0225
+RECOVERY_COEF_LUPROSET = -0.015  # Luproset REDUCES recovery
 
 def calculate_carbon_grades(rougher_air, jameson_air, luproset, feed_carbon):
     """Calculate concentrate and tailings carbon grades based on rougher air, jameson air and luproset"""
@@ -14,17 +23,17 @@ def calculate_carbon_grades(rougher_air, jameson_air, luproset, feed_carbon):
     base_conc_grade = 40.0  # Base concentrate grade
     
     # Rougher air rate effect: higher air rate DECREASES grade (linear relationship)
-    rougher_air_grade_effect = -rougher_air * 0.012  # Decreases grade as air rate increases
+    rougher_air_grade_effect = rougher_air * GRADE_COEF_ROUGHER  # Decreases grade as air rate increases
     
     # Jameson air rate effect: same relationship as rougher air but half the effect
-    jameson_air_grade_effect = -jameson_air * 0.006  # Half the effect of rougher air
+    jameson_air_grade_effect = jameson_air * GRADE_COEF_JAMESON  # Half the effect of rougher air
     
     # Luproset effect: higher luproset INCREASES grade by depressing gangue
-    luproset_grade_effect = luproset * 0.08
+    luproset_grade_effect = luproset * GRADE_COEF_LUPROSET
     
     # Calculate concentrate grade
     concentrate_carbon = base_conc_grade + rougher_air_grade_effect + jameson_air_grade_effect + luproset_grade_effect
-    concentrate_carbon = max(20.0, min(60.0, concentrate_carbon))  # Max 60% as specified
+    concentrate_carbon = np.clip(concentrate_carbon, 20.0, 60.0)  # Max 60% as specified
     
     # Tailings carbon calculation
     # Higher luproset = higher tailings carbon (carbon depressed, stays in tailings)
@@ -32,56 +41,46 @@ def calculate_carbon_grades(rougher_air, jameson_air, luproset, feed_carbon):
     base_tail_grade = feed_carbon * 0.5  # Base case
     
     # Luproset INCREASES tailings carbon (depresses carbon)
-    luproset_tail_effect = luproset * 0.07
+    luproset_tail_effect = luproset * TAIL_COEF_LUPROSET
     
     # Higher rougher air rate DECREASES tailings carbon (more recovery)
-    rougher_air_tail_effect = -rougher_air * 0.005
+    rougher_air_tail_effect = rougher_air * TAIL_COEF_ROUGHER
     
     # Higher jameson air rate DECREASES tailings carbon (more recovery) - half effect
-    jameson_air_tail_effect = -jameson_air * 0.0025
+    jameson_air_tail_effect = jameson_air * TAIL_COEF_JAMESON
     
     tailings_carbon = base_tail_grade + luproset_tail_effect + rougher_air_tail_effect + jameson_air_tail_effect
-    tailings_carbon = max(0.2, min(feed_carbon * 1, tailings_carbon))
+    tailings_carbon = np.clip(tailings_carbon, 0.2, feed_carbon)  # Never above feed carbon
     
     return concentrate_carbon, tailings_carbon
 
 def calculate_mass_balance(feed_carbon, concentrate_carbon, tailings_carbon, feed_tonnage=260):
     """Calculate mass balance for reverse flotation"""
-    try:
+    with np.errstate(divide='ignore', invalid='ignore'):
         # Mass balance: Feed = Concentrate + Tailings
-        concentrate_mass = feed_tonnage * (feed_carbon - tailings_carbon) / (concentrate_carbon - tailings_carbon)
-        tailings_mass = feed_tonnage - concentrate_mass
+        concentrate_mass = feed_tonnage * np.subtract(feed_carbon, tailings_carbon) / np.subtract(concentrate_carbon, tailings_carbon)
         
         # Calculate carbon recovery to concentrate
-        carbon_recovery = (concentrate_mass * concentrate_carbon) / (feed_tonnage * feed_carbon) * 100
-        
-        # Ensure physical constraints
-        concentrate_mass = max(0, min(feed_tonnage * 0.5, concentrate_mass))  # Max 50% to concentrate
-        tailings_mass = feed_tonnage - concentrate_mass
-        carbon_recovery = max(0, min(100, carbon_recovery))
-        
-        return concentrate_mass, tailings_mass, carbon_recovery
-    except:
-        return 10, 90, 50  # Default values if calculation fails
-
-def calculate_zn_loss(carbon_recovery):
-    """Calculate Zn loss based on carbon recovery (0.5% to 4% range)"""
-    # Linear relationship: as carbon recovery increases, Zn loss increases
-    # Recovery range: 10-55%, Zn loss range: 0.5-4%
-    min_recovery, max_recovery = 10, 55
-    min_zn_loss, max_zn_loss = 0.1, 4.0
+        carbon_recovery = (concentrate_mass * concentrate_carbon) / np.multiply(feed_tonnage, feed_carbon) * 100
     
-    # Normalize recovery to 0-1 range
-    normalized_recovery = (carbon_recovery - min_recovery) / (max_recovery - min_recovery)
-    normalized_recovery = max(0, min(1, normalized_recovery))  # Clamp to 0-1
+    # Either division by zero (equal grades or no feed carbon) leaves the split undefined
+    valid = np.isfinite(concentrate_mass) & np.isfinite(carbon_recovery)
     
-    # Calculate Zn loss
-    zn_loss = min_zn_loss + (normalized_recovery * (max_zn_loss - min_zn_loss))
+    # Ensure physical constraints
+    concentrate_mass = np.clip(concentrate_mass, 0, feed_tonnage * 0.5)  # Max 50% to concentrate
+    tailings_mass = feed_tonnage - concentrate_mass
+    carbon_recovery = np.clip(carbon_recovery, 0, 100)
     
-    return zn_loss
+    # Default values where the calculation failed ([()] unwraps scalar inputs to floats)
+    concentrate_mass = np.where(valid, concentrate_mass, 10)[()]
+    tailings_mass = np.where(valid, tailings_mass, 90)[()]
+    carbon_recovery = np.where(valid, carbon_recovery, 50)[()]
+    
+    return concentrate_mass, tailings_mass, carbon_recovery
 
+@st.cache_data(ttl=3600, max_entries=512)
 def calculate_performance(rougher_air, jameson_air, luproset, feed_carbon):
-    """Calculate flotation performance from rougher air, jameson air and luproset"""
+    """Calculate flotation performance from rougher air, jameson air and luproset (scalars or NumPy arrays)"""
     
     # Calculate concentrate and tailings carbon grades
     concentrate_carbon, tailings_carbon = calculate_carbon_grades(rougher_air, jameson_air, luproset, feed_carbon)
@@ -93,30 +92,39 @@ def calculate_performance(rougher_air, jameson_air, luproset, feed_carbon):
     
     # Calculate overall recovery based on air rates and luproset
     # Higher rougher air rate = HIGHER recovery (linear relationship)
-    rougher_air_recovery_effect = rougher_air * 0.045  # Linear increase with air rate
+    rougher_air_recovery_effect = rougher_air * RECOVERY_COEF_ROUGHER  # Linear increase with air rate
     
     # Higher jameson air rate = HIGHER recovery (linear relationship) - half effect
-    jameson_air_recovery_effect = jameson_air * 0.0225  # Half the effect of rougher air
+    jameson_air_recovery_effect = jameson_air * RECOVERY_COEF_JAMESON  # Half the effect of rougher air
     
     # Higher luproset REDUCES recovery (carbon depressed to tailings)
-    luproset_recovery_effect = -luproset * 0.015  # Reduces recovery
+    luproset_recovery_effect = luproset * RECOVERY_COEF_LUPROSET  # Reduces recovery
     
     base_recovery = 0.0  # Base recovery
     total_recovery = base_recovery + rougher_air_recovery_effect + jameson_air_recovery_effect + luproset_recovery_effect
-    total_recovery = max(10, min(55, total_recovery))
+    total_recovery = np.clip(total_recovery, 10, 55)
     
     # Calculate Zn loss
-    zn_loss = calculate_zn_loss(total_recovery)
+    # Linear relationship: as carbon recovery increases, Zn loss increases
+    # Recovery range: 10-55%, Zn loss range: 0.1-4%
+    min_recovery, max_recovery = 10, 55
+    min_zn_loss, max_zn_loss = 0.1, 4.0
+    
+    # Normalize recovery to 0-1 range
+    normalized_recovery = (total_recovery - min_recovery) / (max_recovery - min_recovery)
+    normalized_recovery = np.clip(normalized_recovery, 0, 1)  # Clamp to 0-1
+    
+    zn_loss = min_zn_loss + (normalized_recovery * (max_zn_loss - min_zn_loss))
     
     return total_recovery, concentrate_carbon, tailings_carbon, conc_mass, tail_mass, carbon_recovery, zn_loss
 
-def generate_random_feed_carbon(current_value):
+def generate_random_feed_carbon(current_value, rng):
     """Generate a realistic random feed carbon value with gradual changes"""
     # Generate change within ±0.5% of current value
-    variation = random.uniform(-1,1)
+    variation = rng.uniform(-1, 1)
     new_value = current_value + variation
-    # Keep within realistic bounds
-    return max(3.0, min(6.0, new_value))
+    # Keep within realistic bounds, on the same 0.1% step as the manual slider
+    return round(max(3.0, min(6.0, new_value)), 1)
 
 # Initialize session state
 if 'dynamic_mode' not in st.session_state:
@@ -127,6 +135,8 @@ if 'dynamic_feed_carbon' not in st.session_state:
     st.session_state.dynamic_feed_carbon = 4.5
 if 'update_counter' not in st.session_state:
     st.session_state.update_counter = 0
+if 'feed_rng' not in st.session_state:
+    st.session_state.feed_rng = np.random.default_rng()  # Per-session feed carbon random walk
 
 # Streamlit App
 st.set_page_config(
@@ -153,14 +163,16 @@ with col2:
         st.session_state.dynamic_mode = False
         st.rerun()
 
-with col3:
+# Countdown ticks once a second as a fragment rerun; only the feed carbon update reruns the whole app
+@st.fragment(run_every=1 if st.session_state.dynamic_mode else None)
+def dynamic_mode_status():
     if st.session_state.dynamic_mode:
         current_time = time.time()
         time_since_last_update = current_time - st.session_state.last_update_time
         
         # Update every 60 seconds (1 minute)
         if time_since_last_update >= 30:
-            st.session_state.dynamic_feed_carbon = generate_random_feed_carbon(st.session_state.dynamic_feed_carbon)
+            st.session_state.dynamic_feed_carbon = generate_random_feed_carbon(st.session_state.dynamic_feed_carbon, st.session_state.feed_rng)
             st.session_state.last_update_time = current_time
             st.session_state.update_counter += 1
             st.rerun()
@@ -171,6 +183,9 @@ with col3:
     else:
         st.markdown("**⏸️ Dynamic Mode Inactive**")
 
+with col3:
+    dynamic_mode_status()
+
 # Sidebar controls
 st.sidebar.header("Process Parameters")
 
@@ -188,58 +203,62 @@ if 'luproset_setpoint' not in st.session_state:
 
 st.sidebar.markdown("**Enter New Setpoints:**")
 
-# Input boxes for setpoints
-new_rougher_air = st.sidebar.number_input(
-    "Rougher Air (m3/hr)",
-    min_value=0, max_value=1000, 
-    value=st.session_state.rougher_air_setpoint,
-    step=10,
-    key="rougher_air_input",
-    help="Rougher air rate - HIGHER increases recovery but decreases grade"
-)
+# Input boxes for setpoints - grouped in a form so the app reruns once per submit, not per edit
+with st.sidebar.form("setpoints"):
+    new_rougher_air = st.number_input(
+        "Rougher Air (m3/hr)",
+        min_value=0, max_value=1000, 
+        value=st.session_state.rougher_air_setpoint,
+        step=10,
+        key="rougher_air_input",
+        help="Rougher air rate - HIGHER increases recovery but decreases grade"
+    )
 
-new_jameson_air = st.sidebar.number_input(
-    "Jameson Air (m3/hr)",
-    min_value=0, max_value=600, 
-    value=st.session_state.jameson_air_setpoint,
-    step=5,
-    key="jameson_air_input",
-    help="Jameson air rate - Same effect as rougher air but half the magnitude"
-)
+    new_jameson_air = st.number_input(
+        "Jameson Air (m3/hr)",
+        min_value=0, max_value=600, 
+        value=st.session_state.jameson_air_setpoint,
+        step=5,
+        key="jameson_air_input",
+        help="Jameson air rate - Same effect as rougher air but half the magnitude"
+    )
 
-new_luproset = st.sidebar.number_input(
-    "Luproset Dosage (g/t)",
-    min_value=0, max_value=100, 
-    value=st.session_state.luproset_setpoint,
-    step=1,
-    key="luproset_input",
-    help="Carbon depressant - HIGHER reduces recovery but increases grade"
-)
+    new_luproset = st.number_input(
+        "Luproset Dosage (g/t)",
+        min_value=0, max_value=100, 
+        value=st.session_state.luproset_setpoint,
+        step=1,
+        key="luproset_input",
+        help="Carbon depressant - HIGHER reduces recovery but increases grade"
+    )
+    
+    submitted = st.form_submit_button("Apply Setpoints")
 
-# Auto-apply changes when values change (on Enter key press)
-if (new_rougher_air != st.session_state.rougher_air_setpoint or 
-    new_jameson_air != st.session_state.jameson_air_setpoint or 
-    new_luproset != st.session_state.luproset_setpoint):
+# Apply all three setpoints together on submit (Enter key or button)
+if submitted:
     st.session_state.rougher_air_setpoint = new_rougher_air
     st.session_state.jameson_air_setpoint = new_jameson_air
     st.session_state.luproset_setpoint = new_luproset
 
 # Use the stored setpoints for calculations
-rougher_air = st.session_state.rougher_air_setpoint
-jameson_air = st.session_state.jameson_air_setpoint
-luproset = st.session_state.luproset_setpoint
-
-# Show current setpoints
-st.sidebar.markdown("---")
-st.sidebar.markdown("**Current Setpoints:**")
-st.sidebar.markdown(f"• Rougher Air: **{rougher_air} m³/hr**")
-st.sidebar.markdown(f"• Jameson Air: **{jameson_air} m³/hr**")
-st.sidebar.markdown(f"• Luproset: **{luproset} g/t**")
+# Quantized to input granularity so equal setpoints always map to the same cache key
+rougher_air = int(st.session_state.rougher_air_setpoint)
+jameson_air = int(st.session_state.jameson_air_setpoint)
+luproset = int(st.session_state.luproset_setpoint)
+
+# Show current setpoints (one markdown element instead of five)
+st.sidebar.markdown(
+    "---\n\n"
+    "**Current Setpoints:**\n\n"
+    f"• Rougher Air: **{rougher_air} m³/hr**\n\n"
+    f"• Jameson Air: **{jameson_air} m³/hr**\n\n"
+    f"• Luproset: **{luproset} g/t**"
+)
 
 # Feed carbon - either manual or dynamic
 if st.session_state.dynamic_mode:
-    feed_carbon = st.session_state.dynamic_feed_carbon
-    st.sidebar.markdown(f"**Feed Carbon (Dynamic): {feed_carbon:.2f}%**")
+    feed_carbon = st.session_state.dynamic_feed_carbon  # Already on the slider step
+    st.sidebar.markdown(f"**Feed Carbon (Dynamic): {feed_carbon:.1f}%**")
     st.sidebar.markdown("*Auto-updating every minute*")
 else:
     feed_carbon = st.sidebar.slider(
@@ -247,6 +266,7 @@ else:
         min_value=3.0, max_value=6.0, value=4.5, step=0.1,
         help="Carbon content in feed stream"
     )
+    feed_carbon = round(feed_carbon, 1)  # Slider step
 
 # Calculate performance
 recovery, concentrate_carbon, tailings_carbon, conc_mass, tail_mass, mass_balance_recovery, zn_loss = calculate_performance(
@@ -255,43 +275,25 @@ recovery, concentrate_carbon, tailings_carbon, conc_mass, tail_mass, mass_balanc
 
 # Main dashboard
 st.subheader("Process Performance")
-col1, col2, col3, col4, col5 = st.columns(5)
-
-with col1:
-    st.metric(
-        "Carbon Recovery", 
-        f"{recovery:.1f}%"
-    )
-
-with col2:
-    st.metric(
-        "Concentrate Carbon", 
-        f"{concentrate_carbon:.1f}%"
-    )
+# Custom delta logic for tailings carbon - red if outside 2.8-3.0% range
+if 2.8 <= tailings_carbon <= 3.0:
+    tail_delta = None  # No arrow if in target range
+    tail_delta_color = "normal"
+else:
+    # Always show positive delta value but make it red
+    tail_delta = f"{abs(tailings_carbon - 2.9):.2f}%"
+    tail_delta_color = "inverse"  # Red for any deviation from target range
 
-with col3:
-    # Custom delta logic for tailings carbon - red if outside 2.8-3.0% range
-    if 2.8 <= tailings_carbon <= 3.0:
-        tail_delta = None  # No arrow if in target range
-        tail_delta_color = "normal"
-    else:
-        # Always show positive delta value but make it red
-        tail_delta = f"{abs(tailings_carbon - 2.9):.2f}%"
-        tail_delta_color = "inverse"  # Red for any deviation from target range
-    
-    st.metric(
-        "Tailings Carbon", 
-        f"{tailings_carbon:.2f}%",
-        delta=tail_delta,
-        delta_color=tail_delta_color
-    )
+# (label, value, delta, delta_color) - one metric per column, fifth column left empty
+metrics = [
+    ("Carbon Recovery", f"{recovery:.1f}%", None, "normal"),
+    ("Concentrate Carbon", f"{concentrate_carbon:.1f}%", None, "normal"),
+    ("Tailings Carbon", f"{tailings_carbon:.2f}%", tail_delta, tail_delta_color),
+    ("Zn Loss", f"{zn_loss:.2f}%", None, "normal"),
+]
 
-with col4:
-    st.metric(
-        "Zn Loss", 
-        f"{zn_loss:.2f}%",
-        
-    )
+for col, (label, value, delta, delta_color) in zip(st.columns(5), metrics):
+    col.metric(label, value, delta=delta, delta_color=delta_color)
 
 # Dynamic mode guidance
 if st.session_state.dynamic_mode:
@@ -329,8 +331,3 @@ if st.button("Reset All", type="secondary"):
     st.session_state.dynamic_feed_carbon = 4.5
     st.session_state.update_counter = 0
     st.rerun()
-
-# Auto-refresh for dynamic mode
-if st.session_state.dynamic_mode:
-    time.sleep(1)  # Small delay to prevent excessive refreshing
-    st.rerun()
\ No newline at end of file